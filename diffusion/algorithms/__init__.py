@@ -5,5 +5,6 @@
 
 from diffusion.algorithms.discriminator_schedule import DiscriminatorSchedule
 from diffusion.algorithms.ema import EMA
+from diffusion.algorithms.gpu_image_decode import GPUImageDecode
 
-__all__ = ['EMA', 'DiscriminatorSchedule']
+__all__ = ['EMA', 'DiscriminatorSchedule', 'GPUImageDecode']
@@ -0,0 +1,62 @@
+# Copyright 2022 MosaicML Diffusion authors
+# SPDX-License-Identifier: Apache-2.0
+
+"""Algorithm to decode and preprocess images on the GPU."""
+
+from typing import List
+
+import torch
+from composer.core import Algorithm, Event, State
+from composer.loggers import Logger
+from torchvision.io import ImageReadMode, decode_image, decode_jpeg
+from torchvision.transforms.functional import resize
+
+__all__ = ['GPUImageDecode']
+
+# Every JPEG starts with the SOI marker
+_JPEG_SOI = b'\xff\xd8'
+
+
+class GPUImageDecode(Algorithm):
+    """Decodes, resizes, center crops and normalizes batches of encoded images on the GPU.
+
+    JPEGs are decoded with nvjpeg, PNGs are decoded on the CPU and then moved to the GPU. Images are resized so their
+    smallest side is ``resize_size``, center cropped to a square, and normalized to [-1, 1], matching the
+    ``LargestCenterSquare`` crop and default transform of the CPU dataloader. Batches are decoded after they are
+    loaded for training and before each evaluation forward pass. Use with
+    :class:`~diffusion.datasets.StreamingImageCaptionGPUDecodeDataset`.
+
+    Args:
+        resize_size (int): The size of the square output images. Default: ``256``.
+        image_key (str): The batch key containing the list of encoded images. Default: ``'image'``.
+    """
+
+    def __init__(self, resize_size: int = 256, image_key: str = 'image') -> None:
+        self.resize_size = resize_size
+        self.image_key = image_key
+
+    def match(self, event: Event, state: State) -> bool:
+        # The eval loop does not run AFTER_DATALOADER, so eval batches are decoded right before the forward pass
+        return event in (Event.AFTER_DATALOADER, Event.EVAL_BEFORE_FORWARD) and isinstance(
+            state.batch_get_item(self.image_key), list)
+
+    def apply(self, event: Event, state: State, logger: Logger) -> None:
+        encoded_images: List[bytes] = state.batch_get_item(self.image_key)
+        device = torch.device('cuda', torch.cuda.current_device())
+
+        images = []
+        for encoded_image in encoded_images:
+            data = torch.frombuffer(bytearray(encoded_image), dtype=torch.uint8)
+            if encoded_image[:2] == _JPEG_SOI:
+                img = decode_jpeg(data, mode=ImageReadMode.RGB, device=device)
+            else:
+                img = decode_image(data, mode=ImageReadMode.RGB).to(device, non_blocking=True)
+            img = resize(img, self.resize_size, antialias=True)
+            h, w = img.shape[-2:]
+            c_top = (h - self.resize_size) // 2
+            c_left = (w - self.resize_size) // 2
+            images.append(img[:, c_top:c_top + self.resize_size, c_left:c_left + self.resize_size])
+
+        # Normalize from [0, 255] to [-1, 1]
+        image = torch.stack(images).to(torch.float32).mul_(1 / 127.5).sub_(1.0)
+        state.batch_set_item(self.image_key, image)
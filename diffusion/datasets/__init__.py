@@ -4,7 +4,9 @@
 """Datasets."""
 
 from diffusion.datasets.coco import StreamingCOCOCaption, build_streaming_cocoval_dataloader
-from diffusion.datasets.image_caption import StreamingImageCaptionDataset, build_streaming_image_caption_dataloader
+from diffusion.datasets.cuda_prefetcher import CUDAPrefetcher
+from diffusion.datasets.image_caption import (StreamingImageCaptionDataset, StreamingImageCaptionGPUDecodeDataset,
+                                              build_streaming_image_caption_dataloader)
 from diffusion.datasets.laion import StreamingLAIONDataset, build_streaming_laion_dataloader
 from diffusion.datasets.synthetic_image_caption import (SyntheticImageCaptionDataset,
                                                         build_synthetic_image_caption_dataloader)
@@ -16,6 +18,8 @@ __all__ = [
     'StreamingCOCOCaption',
     'build_streaming_image_caption_dataloader',
     'StreamingImageCaptionDataset',
+    'StreamingImageCaptionGPUDecodeDataset',
     'build_synthetic_image_caption_dataloader',
     'SyntheticImageCaptionDataset',
+    'CUDAPrefetcher',
 ]
@@ -0,0 +1,63 @@
+# Copyright 2022 MosaicML Diffusion authors
+# SPDX-License-Identifier: Apache-2.0
+
+"""Prefetch batches to the GPU on a side CUDA stream."""
+
+from typing import Any, Dict, Iterable, Optional, Union
+
+import torch
+
+__all__ = ['CUDAPrefetcher']
+
+
+class CUDAPrefetcher:
+    """Wraps a dataloader to copy the next batch to the GPU while the current batch is being used.
+
+    The host to device copy of each batch is issued on a dedicated CUDA stream, so it overlaps with the compute on the
+    current stream instead of being serialized before the forward pass. Tensor values of each batch dict are moved to
+    ``device``, other values are passed through unchanged. The dataloader should use ``pin_memory=True``, as it does
+    by default in :func:`~diffusion.datasets.build_streaming_image_caption_dataloader`, since copies from pageable
+    memory are not asynchronous.
+
+    This is meant for custom training loops. Composer's ``Trainer`` moves batches to the device itself, so it should
+    be given the dataloader directly. With DDP, create one prefetcher per rank after ``torch.cuda.set_device`` so
+    that ``device`` is the rank's local GPU; each rank's dataset already reads its own partition of the samples.
+
+    Args:
+        loader (Iterable): The dataloader yielding batch dicts.
+        device (torch.device | str, optional): The CUDA device to move batches to. Default: the current CUDA device.
+    """
+
+    def __init__(self, loader: Iterable, device: Optional[Union[torch.device, str]] = None) -> None:
+        self.loader = loader
+        self.device = torch.device('cuda', torch.cuda.current_device()) if device is None else torch.device(device)
+        self.stream = torch.cuda.Stream(self.device)
+
+    def __len__(self) -> int:
+        return len(self.loader)  # type: ignore
+
+    def __iter__(self):
+        loader_iter = iter(self.loader)
+        next_batch = self._preload(loader_iter)
+        while next_batch is not None:
+            # Wait for the copy of this batch before handing it to the current stream, then start the next copy
+            torch.cuda.current_stream(self.device).wait_stream(self.stream)
+            batch = next_batch
+            for value in batch.values():
+                if isinstance(value, torch.Tensor):
+                    # The batch was allocated on the side stream, so mark it as used by the current stream to keep
+                    # the caching allocator from reusing its memory too early
+                    value.record_stream(torch.cuda.current_stream(self.device))
+            next_batch = self._preload(loader_iter)
+            yield batch
+
+    def _preload(self, loader_iter) -> Optional[Dict[str, Any]]:
+        try:
+            raw_batch = next(loader_iter)
+        except StopIteration:
+            return None
+        with torch.cuda.stream(self.stream):
+            return {
+                key: value.to(self.device, non_blocking=True) if isinstance(value, torch.Tensor) else value
+                for key, value in raw_batch.items()
+            }
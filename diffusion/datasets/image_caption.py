@@ -4,18 +4,24 @@
 """Streaming Image-Caption dataset."""
 
 import logging
+import math
+import os
 import random
 from io import BytesIO
-from typing import Callable, Dict, List, Optional, Sequence, Union
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import torch
+from composer.core import DataSpec
+from huggingface_hub import snapshot_download
 from PIL import Image
 from streaming import Stream, StreamingDataset
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, default_collate, get_worker_info
 from torchvision import transforms
 from transformers import AutoTokenizer
 
-from diffusion.datasets.laion.transforms import LargestCenterSquare, RandomCropAspectRatioTransorm, RandomCropSquare
+from diffusion.datasets.laion.transforms import (LargestCenterSquare, RandomCropAspectRatioTransorm, RandomCropSquare,
+                                                 pil_to_norm_tensor)
 from diffusion.models.models import SDXLTokenizer
 
 log = logging.getLogger(__name__)
@@ -23,6 +29,24 @@ log = logging.getLogger(__name__)
 # Disable PIL max image size limit
 Image.MAX_IMAGE_PIXELS = None
 
+_MICROCOND_KEYS = ('cond_crops_coords_top_left', 'cond_original_size', 'cond_target_size')
+
+# Image formats that ``torchvision.io.decode_image`` can read
+_GPU_DECODE_FORMATS = ('JPEG', 'PNG')
+
+
+def _new_batch_tensor(shape: Tuple[int, ...], dtype: torch.dtype) -> torch.Tensor:
+    """Allocates an uninitialized batch tensor, in shared memory when called in a DataLoader worker.
+
+    Like ``default_collate``, this builds worker batches directly in shared memory, so sending them to the main
+    process does not copy them again.
+    """
+    if get_worker_info() is None:
+        return torch.empty(shape, dtype=dtype)
+    elem = torch.empty(0, dtype=dtype)
+    storage = elem._typed_storage()._new_shared(math.prod(shape), device=elem.device)
+    return elem.new(storage).resize_(shape)
+
 
 class StreamingImageCaptionDataset(StreamingDataset):
     """Streaming dataset for image-caption pairs.
@@ -39,11 +63,19 @@ class StreamingImageCaptionDataset(StreamingDataset):
             'first' selects the first caption in the list and 'random' selects a random caption in the list.
             If there is only one caption, this argument is ignored. Default: ``'first'``.
         crop (Callable, optional): The crop transform to apply to the image before ``transform``. Default: ``None``
+        resize_size (int, optional): The size the crop resizes the shortest image side to. If set, JPEGs are decoded
+            at a reduced DCT scale that keeps both sides at least twice this size. Default: ``None``.
         transform (Callable, optional): The transforms to apply to the image. Default: ``None``.
         image_key (str): Key associated with the image in the streaming dataset. Default: ``'image'``.
         caption_key (str): Key associated with the caption in the streaming dataset. Default: ``'caption'``.
         sdxl (bool): Whether or not we're training SDXL. Default: `False`.
         zero_dropped_captions (bool): If True, zero out text embeddings for dropped captions. Default: ``False``.
+        precomputed_image_size (int, optional): If set, load the images of this size written by
+            ``scripts/precompute_images.py`` instead of decoding ``image_key``. ``crop`` and ``transform`` are
+            skipped. Default: ``None``.
+        precomputed_image_dtype (str): The dtype of the precomputed images, either ``'float16'`` for images
+            normalized to [-1, 1] or ``'uint8'`` for raw pixels. ``'uint8'`` images are returned as uint8 tensors and
+            normalized on the GPU by the model, halving host to device traffic. Default: ``'float16'``.
 
         **streaming_kwargs: Additional arguments to pass in the construction of the StreamingDataloader
     """
@@ -58,11 +90,14 @@ class StreamingImageCaptionDataset(StreamingDataset):
         microcond_drop_prob: float = 0.0,
         caption_selection: str = 'first',
         crop: Optional[Callable] = None,
+        resize_size: Optional[int] = None,
         transform: Optional[Callable] = None,
         image_key: str = 'image',
         caption_key: str = 'caption',
         sdxl: bool = False,
         zero_dropped_captions: bool = False,
+        precomputed_image_size: Optional[int] = None,
+        precomputed_image_dtype: str = 'float16',
         **streaming_kwargs,
     ) -> None:
 
@@ -79,8 +114,12 @@ class StreamingImageCaptionDataset(StreamingDataset):
         caption_selection = caption_selection.lower()
         if caption_selection not in ['first', 'random']:
             raise ValueError(f'Invalid caption selection: {caption_selection}. Must be one of [random, first]')
+        if precomputed_image_dtype not in ['float16', 'uint8']:
+            raise ValueError(
+                f'Invalid precomputed image dtype: {precomputed_image_dtype}. Must be one of [float16, uint8]')
 
         self.crop = crop
+        self.resize_size = resize_size
         self.transform = transform
         self.sdxl = sdxl
         self.caption_drop_prob = caption_drop_prob
@@ -89,23 +128,82 @@ class StreamingImageCaptionDataset(StreamingDataset):
         self.image_key = image_key
         self.caption_key = caption_key
         self.zero_dropped_captions = zero_dropped_captions
-
+        self.precomputed_image_size = precomputed_image_size
+        self.precomputed_image_dtype = precomputed_image_dtype
+        # Whether transformed images are arrays or PIL images, resolved from the first sample
+        self._image_is_array = None
+
+        # The tokenizer is built lazily, so each DataLoader worker builds its own instead of inheriting a copy. Its
+        # files are resolved once here, so workers load them from disk instead of each querying the hub.
+        self.tokenizer_name_or_path = tokenizer_name_or_path
+        if os.path.isdir(tokenizer_name_or_path):
+            self._tokenizer_path = tokenizer_name_or_path
+        else:
+            self._tokenizer_path = snapshot_download(tokenizer_name_or_path,
+                                                     allow_patterns=['tokenizer/*', 'tokenizer_2/*'])
+        self._tokenizer = None
+        self._max_length = None
+        self._empty_input_ids = None
+        self._empty_attention_mask = None
+
+    @property
+    def tokenizer(self):
+        """The caption tokenizer, built on first access."""
+        if self._tokenizer is None:
+            self.build_tokenizer()
+        return self._tokenizer
+
+    def build_tokenizer(self) -> None:
+        """Builds the caption tokenizer in the current process."""
         if self.sdxl:
-            self.tokenizer = SDXLTokenizer(tokenizer_name_or_path)
+            self._tokenizer = SDXLTokenizer(self._tokenizer_path, local_files_only=True)
         else:
-            self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name_or_path, subfolder='tokenizer')
+            self._tokenizer = AutoTokenizer.from_pretrained(self._tokenizer_path,
+                                                            subfolder='tokenizer',
+                                                            local_files_only=True)
+        # SDXLTokenizer picks each of its tokenizers' max length when given ``None``
+        self._max_length = None if self.sdxl else self._tokenizer.model_max_length  # type: ignore
+        # Dropped captions are all empty, so their tokens are computed once here instead of in every batch
+        self._empty_input_ids, self._empty_attention_mask = self._tokenize([''])
+
+    def _tokenize(self, captions: List[str]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Tokenizes captions into ``[B, 77]`` token ids, or ``[B, 2, 77]`` for SDXL, and a ``[B, 77]`` mask."""
+        tokenizer_out = self.tokenizer(captions,
+                                       padding='max_length',
+                                       max_length=self._max_length,
+                                       truncation=True,
+                                       return_tensors='np' if self.sdxl else 'pt')
+        if self.sdxl:
+            # Stack to [B, 2, 77] with one row per tokenizer into a single numpy buffer, which is wrapped without copying
+            tokenized_caption = torch.from_numpy(np.stack(tokenizer_out.input_ids, axis=1))
+            # Take union over both tokenizers padding masks. Both pad to 77 tokens and hold 0/1 ints, so this is a
+            # bitwise or that keeps the mask dtype.
+            attention_mask = torch.from_numpy(np.bitwise_or(*tokenizer_out.attention_mask))
+        else:
+            tokenized_caption = tokenizer_out.input_ids
+            attention_mask = tokenizer_out.attention_mask
+        return tokenized_caption, attention_mask
 
-    def __getitem__(self, index):
-        sample = super().__getitem__(index)
-        out = {}
+    def _load_image(self, sample: Dict) -> Tuple[Any, Tuple[int, int], Tuple[int, int]]:
+        """Decodes, crops and transforms a sample's image.
+
+        Returns:
+            The image, its original ``(width, height)`` and the ``(top, left)`` crop coordinates.
+        """
+        if self.precomputed_image_size is not None:
+            return self._load_precomputed_image(sample)
 
-        # Image
         img = sample[self.image_key]
         if not isinstance(img, Image.Image):
             img = Image.open(BytesIO(sample[self.image_key]))
+        orig_w, orig_h = img.size
+        if self.resize_size is not None:
+            # Let libjpeg skip most of the IDCT work for large JPEGs. This is a no-op for other formats.
+            img.draft('RGB', (2 * self.resize_size, 2 * self.resize_size))
+        # Color JPEGs already decode as RGB, so only other modes pay for the copy made by ``convert``. ``convert``
+        # decodes the image once through ``load``, and for RGBA it drops the alpha channel in a single pass.
         if img.mode != 'RGB':
             img = img.convert('RGB')
-        orig_w, orig_h = img.size
 
         # Image transforms
         if self.crop is not None:
@@ -114,33 +212,69 @@ class StreamingImageCaptionDataset(StreamingDataset):
             crop_top, crop_left = 0, 0
         if self.transform is not None:
             img = self.transform(img)
+        return img, (orig_w, orig_h), (crop_top, crop_left)
+
+    def _load_precomputed_image(self, sample: Dict) -> Tuple[Any, Tuple[int, int], Tuple[int, int]]:
+        """Loads an image that was already cropped by ``scripts/precompute_images.py``.
+
+        The image is returned as a numpy array, which ``collate_fn`` stacks into the batch tensor.
+        """
+        size = self.precomputed_image_size
+        assert size is not None
+        if self.precomputed_image_dtype == 'uint8':
+            # Dequantized on the GPU by the model
+            img = np.frombuffer(sample[f'image_uint8_{size}x{size}'], dtype=np.uint8).reshape(3, size, size)
+        else:
+            img = np.frombuffer(sample[f'image_fp16_{size}x{size}'], dtype=np.float16).reshape(3, size, size)
+            img = img.astype(np.float32)
+        orig_size = (sample['image_width'], sample['image_height'])
+        crop_coords = (sample[f'crop_top_{size}'], sample[f'crop_left_{size}'])
+        return img, orig_size, crop_coords
+
+    def _image_size(self, img: Any) -> Tuple[int, int]:
+        """Returns the ``(width, height)`` of an image returned by ``_load_image``."""
+        if self._image_is_array is None:
+            # The output type only depends on the configured transforms, so it is only checked once
+            if isinstance(img, (torch.Tensor, np.ndarray)):
+                self._image_is_array = True
+            elif isinstance(img, Image.Image):
+                self._image_is_array = False
+            else:
+                raise ValueError('Image after transformations must either be a PIL Image or Torch Tensor')
+        if self._image_is_array:
+            return img.shape[-1], img.shape[-2]
+        return img.size
+
+    def __getitem__(self, index):
+        sample = super().__getitem__(index)
+        out = {}
+
+        # Image
+        img, (orig_w, orig_h), (crop_top, crop_left) = self._load_image(sample)
         out['image'] = img
 
         # SDXL microconditioning on image characteristics
         if self.sdxl:
             # Get the new height and width
-            if isinstance(img, torch.Tensor):
-                img_h, img_w = img.shape[-2], img.shape[-1]
-            elif isinstance(img, Image.Image):
-                img_w, img_h = img.size
-            else:
-                raise ValueError('Image after transformations must either be a PIL Image or Torch Tensor')
+            img_w, img_h = self._image_size(img)
 
-            out['cond_crops_coords_top_left'] = torch.tensor([crop_top, crop_left])
-            out['cond_original_size'] = torch.tensor([orig_w, orig_h])
-            out['cond_target_size'] = torch.tensor([img_w, img_h])
+            # Kept as tuples of ints here, these are tensorized per batch in ``collate_fn``
+            out['cond_crops_coords_top_left'] = (crop_top, crop_left)
+            out['cond_original_size'] = (orig_w, orig_h)
+            out['cond_target_size'] = (img_w, img_h)
 
             # Microconditioning dropout as in Stability repo
             # https://github.com/Stability-AI/generative-models/blob/477d8b9a7730d9b2e92b326a770c0420d00308c9/sgm/modules/encoders/modules.py#L151-L160
-            if torch.rand(1) < self.microcond_drop_prob:
-                out['cond_crops_coords_top_left'] = out['cond_crops_coords_top_left'] * 0
-            if torch.rand(1) < self.microcond_drop_prob:
-                out['cond_original_size'] = out['cond_original_size'] * 0
-            if torch.rand(1) < self.microcond_drop_prob:
-                out['cond_target_size'] = out['cond_target_size'] * 0
+            if random.random() < self.microcond_drop_prob:
+                out['cond_crops_coords_top_left'] = (0, 0)
+            if random.random() < self.microcond_drop_prob:
+                out['cond_original_size'] = (0, 0)
+            if random.random() < self.microcond_drop_prob:
+                out['cond_target_size'] = (0, 0)
 
         # Caption
-        if torch.rand(1) < self.caption_drop_prob:
+        # Python's RNG is seeded per worker by the DataLoader, so this avoids allocating tensors for each draw
+        if random.random() < self.caption_drop_prob:
             caption = ''
             if self.zero_dropped_captions:
                 out['drop_caption_mask'] = 0.0
@@ -148,32 +282,121 @@ class StreamingImageCaptionDataset(StreamingDataset):
                 out['drop_caption_mask'] = 1.0
         else:
             caption = sample[self.caption_key]
-            if isinstance(caption, List) and self.caption_selection == 'first':
+            if isinstance(caption, list) and self.caption_selection == 'first':
                 caption = caption[0]
-            if isinstance(caption, List) and self.caption_selection == 'random':
-                caption = random.sample(caption, k=1)[0]
+            if isinstance(caption, list) and self.caption_selection == 'random':
+                caption = caption[random.randrange(len(caption))]
             out['drop_caption_mask'] = 1.0
 
-        max_length = None if self.sdxl else self.tokenizer.model_max_length  # type: ignore
-        tokenizer_out = self.tokenizer(caption,
-                                       padding='max_length',
-                                       max_length=max_length,
-                                       truncation=True,
-                                       return_tensors='pt')
+        out['captions'] = caption
+        return out
+
+    def collate_fn(self, batch: List[Dict]) -> Dict:
+        """Collates samples into a batch, tokenizing all of the batch's captions with a single tokenizer call.
+
+        Args:
+            batch (List[Dict]): Samples returned by ``__getitem__``.
+        """
+        captions = [sample.pop('captions') for sample in batch]
+        # Build each [B, 2] SDXL microconditioning tensor with a single allocation
+        batched = {}
         if self.sdxl:
-            tokenized_caption = [tokenized_cap.squeeze() for tokenized_cap in tokenizer_out.input_ids]
-            tokenized_caption = torch.stack(tokenized_caption)
-            # Take union over both tokenizers padding masks
-            attention_masks = tokenizer_out.attention_mask
-            attention_mask = torch.logical_or(attention_masks[0], attention_masks[1]).to(attention_masks[0].dtype)
+            for key in _MICROCOND_KEYS:
+                batched[key] = torch.tensor([sample.pop(key) for sample in batch])
+        # Stack numpy fields straight into the batch tensor's memory
+        for key, value in list(batch[0].items()):
+            if isinstance(value, np.ndarray):
+                dtype = torch.from_numpy(np.empty(0, dtype=value.dtype)).dtype
+                batched[key] = _new_batch_tensor((len(batch), *value.shape), dtype)
+                np.stack([sample.pop(key) for sample in batch], out=batched[key].numpy())
+        out = default_collate(batch)
+        out.update(batched)
+
+        # Only tokenize captions that were not dropped, and fill in the precomputed empty caption tokens for the rest
+        kept = [i for i, caption in enumerate(captions) if caption]
+        if len(kept) == len(captions):
+            tokenized_caption, attention_mask = self._tokenize(captions)
         else:
-            tokenized_caption = tokenizer_out.input_ids.squeeze()
-            attention_mask = tokenizer_out.attention_mask
+            if self._empty_input_ids is None:
+                self.build_tokenizer()
+            assert self._empty_input_ids is not None and self._empty_attention_mask is not None
+            tokenized_caption = self._empty_input_ids.expand(len(captions), *self._empty_input_ids.shape[1:]).clone()
+            attention_mask = self._empty_attention_mask.expand(len(captions), -1).clone()
+            if kept:
+                tokenized_caption[kept], attention_mask[kept] = self._tokenize([captions[i] for i in kept])
         out['captions'] = tokenized_caption
-        out['attention_mask'] = attention_mask
+        # Keep the [B, 1, 77] attention mask shape of per-sample tokenization
+        out['attention_mask'] = attention_mask.unsqueeze(1)
+        return out
+
+
+class StreamingImageCaptionGPUDecodeDataset(StreamingImageCaptionDataset):
+    """Streaming dataset for image-caption pairs that leaves image decoding to the GPU.
+
+    Images are returned as their raw encoded bytes, and only the image header is parsed on the CPU to compute the
+    SDXL microconditioning for a center crop. Use with the :class:`~diffusion.algorithms.GPUImageDecode` algorithm,
+    which decodes, resizes, center crops and normalizes each batch on the GPU. Only JPEG and PNG images are
+    supported, since those are the formats torchvision can decode.
+
+    Args:
+        resize_size (int): The size of the square center crop produced by ``GPUImageDecode``. Default: ``256``.
+        **kwargs: Additional arguments to pass to ``StreamingImageCaptionDataset``. ``crop`` and ``transform`` are
+            not supported.
+    """
+
+    def __init__(self, resize_size: int = 256, **kwargs) -> None:
+        if kwargs.get('crop') is not None or kwargs.get('transform') is not None:
+            raise ValueError('StreamingImageCaptionGPUDecodeDataset does not support crop or transform.')
+        super().__init__(resize_size=resize_size, **kwargs)
+
+    def _load_image(self, sample: Dict) -> Tuple[Any, Tuple[int, int], Tuple[int, int]]:
+        img_bytes = sample[self.image_key]
+        if not isinstance(img_bytes, bytes):
+            raise ValueError(f'GPU decoding requires raw image bytes, got {type(img_bytes)}.')
+        # Opening the image only parses its header
+        img = Image.open(BytesIO(img_bytes))
+        if img.format not in _GPU_DECODE_FORMATS:
+            raise ValueError(f'GPU decoding only supports {_GPU_DECODE_FORMATS} images, got {img.format}.')
+        orig_w, orig_h = img.size
+
+        # Match the crop of LargestCenterSquare: resize the smallest side to resize_size, then center crop
+        assert self.resize_size is not None
+        if orig_w <= orig_h:
+            resized_w, resized_h = self.resize_size, int(self.resize_size * orig_h / orig_w)
+        else:
+            resized_w, resized_h = int(self.resize_size * orig_w / orig_h), self.resize_size
+        crop_top = (resized_h - self.resize_size) // 2
+        crop_left = (resized_w - self.resize_size) // 2
+        return img_bytes, (orig_w, orig_h), (crop_top, crop_left)
+
+    def _image_size(self, img: Any) -> Tuple[int, int]:
+        assert self.resize_size is not None
+        return self.resize_size, self.resize_size
+
+    def collate_fn(self, batch: List[Dict]) -> Dict:
+        """Collates samples into a batch, keeping the encoded images as a list of ``bytes``.
+
+        Args:
+            batch (List[Dict]): Samples returned by ``__getitem__``.
+        """
+        images = [sample.pop('image') for sample in batch]
+        out = super().collate_fn(batch)
+        out['image'] = images
         return out
 
 
+def _build_worker_tokenizer(worker_id: int) -> None:
+    """Builds the dataset's tokenizer when a DataLoader worker starts rather than on its first batch."""
+    worker_info = get_worker_info()
+    assert worker_info is not None
+    worker_info.dataset.build_tokenizer()  # type: ignore
+
+
+def _get_num_samples_in_batch(batch: Dict) -> int:
+    """Counts the samples of a batch from its captions, since encoded images are a list of ``bytes``."""
+    return batch['captions'].shape[0]
+
+
 def build_streaming_image_caption_dataloader(
     remote: Union[str, List],
     local: Union[str, List],
@@ -188,6 +411,9 @@ def build_streaming_image_caption_dataloader(
     caption_key: str = 'caption',
     crop_type: Optional[str] = 'square',
     zero_dropped_captions: bool = True,
+    gpu_decode: bool = False,
+    precomputed_images: bool = False,
+    precomputed_image_dtype: str = 'float16',
     streaming_kwargs: Optional[Dict] = None,
     dataloader_kwargs: Optional[Dict] = None,
 ):
@@ -209,14 +435,34 @@ def build_streaming_image_caption_dataloader(
         caption_key (str): Key associated with the caption in the streaming dataset. Default: ``'caption'``.
         crop_type (str, optional): Type of crop to perform, either ['square', 'random', 'aspect_ratio']. Default: ``'square'``.
         zero_dropped_captions (bool): If True, zero out text embeddings for dropped captions. Default: ``True``.
+        gpu_decode (bool): If True, return encoded images to be decoded on the GPU by the
+            :class:`~diffusion.algorithms.GPUImageDecode` algorithm. Requires ``crop_type='square'``, ignores
+            ``transform`` and only supports JPEG and PNG images. The dataloader is returned in a ``DataSpec`` that
+            counts samples from the captions. Default: ``False``.
+        precomputed_images (bool): If True, load the ``resize_size`` images precomputed by
+            ``scripts/precompute_images.py`` instead of decoding, cropping and transforming ``image_key``. Requires
+            ``crop_type='square'`` and no ``transform``. Default: ``False``.
+        precomputed_image_dtype (str): The dtype of the precomputed images, either ``'float16'`` or ``'uint8'``.
+            Default: ``'float16'``.
         streaming_kwargs (dict, optional): Additional arguments to pass to the ``StreamingDataset``. Default: ``None``.
-        dataloader_kwargs (dict, optional): Additional arguments to pass to the ``DataLoader``. Default: ``None``.
+        dataloader_kwargs (dict, optional): Additional arguments to pass to the ``DataLoader``. Unless overridden,
+            ``pin_memory=True`` and ``num_workers=max(4, cpu_count // num_gpus)`` are used, along with
+            ``persistent_workers=True`` and ``prefetch_factor=2`` when ``num_workers > 0``. Default: ``None``.
     """
     # Check crop type
     if crop_type is not None:
         crop_type = crop_type.lower()
         if crop_type not in ['square', 'random', 'aspect_ratio']:
             raise ValueError(f'Invalid crop_type: {crop_type}. Must be ["square", "random", "aspect_ratio", None]')
+    if gpu_decode and crop_type != 'square':
+        raise ValueError(f'gpu_decode only supports crop_type="square", got {crop_type}')
+    if gpu_decode and precomputed_images:
+        raise ValueError('gpu_decode and precomputed_images cannot both be set')
+    # scripts/precompute_images.py stores LargestCenterSquare crops that are already normalized
+    if precomputed_images and crop_type != 'square':
+        raise ValueError(f'precomputed_images only supports crop_type="square", got {crop_type}')
+    if precomputed_images and transform is not None:
+        raise ValueError('precomputed_images does not support a custom transform')
 
     # Handle ``None`` kwargs
     if streaming_kwargs is None:
@@ -245,36 +491,73 @@ def build_streaming_image_caption_dataloader(
     if sdxl:
         log.info('Detected SDXL tokenizer, using SDXL crop transform and tokenizers.')
 
-    # Set the crop to apply
+    # Set the crop to apply. Only the square crops resize to ``resize_size``, so only they can use draft decoding.
+    draft_size = None
     if crop_type == 'square':
         crop = LargestCenterSquare(resize_size)
+        draft_size = resize_size
     elif crop_type == 'random':
         crop = RandomCropSquare(resize_size)
+        draft_size = resize_size
     elif crop_type == 'aspect_ratio':
         crop = RandomCropAspectRatioTransorm()
     else:
         crop = None
 
     if transform is None:
-        transform = [transforms.ToTensor(), transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))]
+        transform = [pil_to_norm_tensor]
     transform = transforms.Compose(transform)
     assert isinstance(transform, Callable)
 
-    dataset = StreamingImageCaptionDataset(
-        streams=streams,
-        tokenizer_name_or_path=tokenizer_name_or_path,
-        caption_drop_prob=caption_drop_prob,
-        microcond_drop_prob=microcond_drop_prob,
-        caption_selection=caption_selection,
-        crop=crop,
-        transform=transform,
-        image_key=image_key,
-        caption_key=caption_key,
-        batch_size=batch_size,
-        sdxl=sdxl,
-        zero_dropped_captions=zero_dropped_captions,
-        **streaming_kwargs,
-    )
+    if gpu_decode:
+        # Decoding, cropping and normalization happen on the GPU
+        dataset = StreamingImageCaptionGPUDecodeDataset(
+            streams=streams,
+            tokenizer_name_or_path=tokenizer_name_or_path,
+            caption_drop_prob=caption_drop_prob,
+            microcond_drop_prob=microcond_drop_prob,
+            caption_selection=caption_selection,
+            resize_size=resize_size,
+            image_key=image_key,
+            caption_key=caption_key,
+            batch_size=batch_size,
+            sdxl=sdxl,
+            zero_dropped_captions=zero_dropped_captions,
+            **streaming_kwargs,
+        )
+    else:
+        dataset = StreamingImageCaptionDataset(
+            streams=streams,
+            tokenizer_name_or_path=tokenizer_name_or_path,
+            caption_drop_prob=caption_drop_prob,
+            microcond_drop_prob=microcond_drop_prob,
+            caption_selection=caption_selection,
+            crop=crop,
+            resize_size=draft_size,
+            transform=transform,
+            image_key=image_key,
+            caption_key=caption_key,
+            batch_size=batch_size,
+            sdxl=sdxl,
+            zero_dropped_captions=zero_dropped_captions,
+            precomputed_image_size=resize_size if precomputed_images else None,
+            precomputed_image_dtype=precomputed_image_dtype,
+            **streaming_kwargs,
+        )
+
+    # Captions are tokenized per batch in the dataset's collate function
+    dataloader_kwargs = {'collate_fn': dataset.collate_fn, **dataloader_kwargs}
+    dataloader_kwargs.setdefault('worker_init_fn', _build_worker_tokenizer)
+    # Pinned memory lets host to device copies overlap with compute
+    dataloader_kwargs.setdefault('pin_memory', True)
+    if 'num_workers' not in dataloader_kwargs:
+        # Split the CPUs among the local devices, but keep at least 4 workers
+        num_devices = max(torch.cuda.device_count(), 1)
+        dataloader_kwargs['num_workers'] = max(4, (os.cpu_count() or 1) // num_devices)
+    if dataloader_kwargs['num_workers'] > 0:
+        dataloader_kwargs.setdefault('persistent_workers', True)
+        # Prefetching more than 2 batches per worker gives diminishing returns and risks host OOMs
+        dataloader_kwargs.setdefault('prefetch_factor', 2)
 
     dataloader = DataLoader(
         dataset=dataset,
@@ -283,4 +566,7 @@ def build_streaming_image_caption_dataloader(
         **dataloader_kwargs,
     )
 
+    if gpu_decode:
+        # Composer counts the samples of a batch before the images are decoded
+        return DataSpec(dataloader, get_num_samples_in_batch=_get_num_samples_in_batch)
     return dataloader
@@ -3,10 +3,75 @@
 
 """Transforms for the training and eval dataset."""
 
+import warnings
+
 import torch
 import torchvision.transforms as transforms
+from PIL import Image
 from torchvision.transforms import RandomCrop
-from torchvision.transforms.functional import crop
+from torchvision.transforms.functional import InterpolationMode, crop
+
+try:
+    import numba  # type: ignore
+    is_numba_installed = True
+except ImportError:
+    is_numba_installed = False
+
+if is_numba_installed:
+
+    # Each dataloader worker is its own process, so the kernel stays single threaded to avoid oversubscription
+    @numba.njit(cache=True, fastmath=True)
+    def _u8hwc_to_f32chw_norm(src, dst):
+        """Writes the uint8 HWC image ``src`` into the float32 CHW array ``dst`` normalized to [-1, 1]."""
+        h, w, c = src.shape
+        for y in range(h):
+            for x in range(w):
+                for k in range(c):
+                    dst[k, y, x] = src[y, x, k] * (1 / 127.5) - 1.0
+
+
+def pil_to_norm_tensor(img):
+    """Converts a PIL image to a float tensor normalized to [-1, 1].
+
+    Equivalent to ``transforms.Compose([transforms.ToTensor(), transforms.Normalize((0.5,) * 3, (0.5,) * 3)])`` for
+    RGB images, but casts, permutes and normalizes without intermediate tensors. If ``numba`` is installed, this is
+    done in a single compiled pass.
+    """
+    # Wrap the decoded pixel buffer directly so the only uint8 copy is the one made by ``tobytes``
+    img.load()
+    w, h = img.size
+    with warnings.catch_warnings():
+        # The buffer is read-only, but it is only ever read from below
+        warnings.simplefilter('ignore', UserWarning)
+        t = torch.frombuffer(img.tobytes(), dtype=torch.uint8)
+    t = t.view(h, w, len(img.getbands()))
+    if is_numba_installed:
+        # Cast, permute and normalize in one compiled pass
+        out = torch.empty((t.shape[2], h, w), dtype=torch.float32)
+        _u8hwc_to_f32chw_norm(t.numpy(), out.numpy())
+        return out
+    t = t.permute(2, 0, 1)
+    out = torch.empty(t.shape, dtype=torch.float32)
+    out.copy_(t)
+    # (x / 255 - 0.5) / 0.5 == x / 127.5 - 1
+    out.mul_(1 / 127.5).sub_(1.0)
+    return out
+
+
+def _resize_shortest_side(img, size, resample):
+    """Resizes a PIL image so its shortest side is ``size``, computing the output size like ``transforms.Resize``.
+
+    Calling ``Image.resize`` directly skips torchvision's per-call argument handling and dispatch. Bilinear resampling
+    hits the SSE4/AVX2 kernels when Pillow-SIMD is installed.
+    """
+    w, h = img.size
+    if w <= h:
+        resized_size = (size, int(size * h / w))
+    else:
+        resized_size = (int(size * w / h), size)
+    if resized_size == (w, h):
+        return img
+    return img.resize(resized_size, resample)
 
 
 class LargestCenterSquare:
@@ -15,10 +80,11 @@ class LargestCenterSquare:
     def __init__(self, size):
         self.size = size
         self.center_crop = transforms.CenterCrop(self.size)
+        self.resample = Image.BILINEAR
 
     def __call__(self, img):
         # First, resize the image such that the smallest side is self.size while preserving aspect ratio.
-        img = transforms.functional.resize(img, self.size, antialias=True)
+        img = _resize_shortest_side(img, self.size, self.resample)
 
         # Then take a center crop to a square.
         w, h = img.size
@@ -34,10 +100,11 @@ class RandomCropSquare:
     def __init__(self, size):
         self.size = size
         self.random_crop = RandomCrop(size)
+        self.resample = Image.BILINEAR
 
     def __call__(self, img):
         # First, resize the image such that the smallest side is self.size while preserving aspect ratio.
-        img = transforms.functional.resize(img, self.size, antialias=True)
+        img = _resize_shortest_side(img, self.size, self.resample)
         # Then take a center crop to a square & return crop params.
         c_top, c_left, h, w = self.random_crop.get_params(img, (self.size, self.size))
         img = crop(img, c_top, c_left, h, w)
@@ -77,7 +144,7 @@ class RandomCropAspectRatioTransorm:
             resize_size = (target_height, round(h_scale * orig_w))
         else:
             resize_size = (target_height, target_width)
-        img = transforms.functional.resize(img, resize_size, antialias=True)
+        img = transforms.functional.resize(img, resize_size, interpolation=InterpolationMode.BILINEAR, antialias=True)
 
         # Crop based on aspect ratio
         c_top, c_left, height, width = transforms.RandomCrop.get_params(img, output_size=(target_height, target_width))
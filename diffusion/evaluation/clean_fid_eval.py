@@ -137,6 +137,9 @@ class CleanFIDEvaluator:
                 break
 
             real_images = batch[self.image_key]
+            if real_images.dtype == torch.uint8:
+                # Scale images precomputed as uint8 pixels to [0, 1]
+                real_images = real_images.float().div_(255)
             captions = batch[self.caption_key]
             if self.sdxl:
                 crop_params = batch['cond_crops_coords_top_left']
@@ -581,11 +581,16 @@ class SDXLTokenizer:
 
     Args:
         model_name (str): Name of the model's text encoders to load. Defaults to 'stabilityai/stable-diffusion-xl-base-1.0'.
+        local_files_only (bool): If True, only load the tokenizers from local files. Defaults to False.
     """
 
-    def __init__(self, model_name='stabilityai/stable-diffusion-xl-base-1.0'):
-        self.tokenizer = CLIPTokenizer.from_pretrained(model_name, subfolder='tokenizer')
-        self.tokenizer_2 = CLIPTokenizer.from_pretrained(model_name, subfolder='tokenizer_2')
+    def __init__(self, model_name='stabilityai/stable-diffusion-xl-base-1.0', local_files_only=False):
+        self.tokenizer = CLIPTokenizer.from_pretrained(model_name,
+                                                       subfolder='tokenizer',
+                                                       local_files_only=local_files_only)
+        self.tokenizer_2 = CLIPTokenizer.from_pretrained(model_name,
+                                                         subfolder='tokenizer_2',
+                                                         local_files_only=local_files_only)
 
     def __call__(self, prompt, padding, truncation, return_tensors, max_length=None):
         tokenized_output = self.tokenizer(
@@ -169,6 +169,15 @@ class StableDiffusion(ComposerModel):
             self.vae._fsdp_wrap = False
             self.unet._fsdp_wrap = True
 
+    def _dequantize_images(self, batch):
+        """Dequantizes images that were sent to the device as uint8 from [0, 255] to [-1, 1] in place in the batch.
+
+        The result is written back to the batch so metrics updated from it also see the dequantized images.
+        """
+        images = batch[self.image_key]
+        if images.dtype == torch.uint8:
+            batch[self.image_key] = images.to(torch.float32).mul_(1 / 127.5).sub_(1.0)
+
     def forward(self, batch):
         latents, conditioning, conditioning_2, pooled_conditioning = None, None, None, None
         # Use latents if specified and available. When specified, they might not exist during eval
@@ -177,6 +186,7 @@ class StableDiffusion(ComposerModel):
                 raise NotImplementedError('SDXL not yet supported with precomputed latents')
             latents, conditioning = batch[self.image_latents_key], batch[self.text_latents_key]
         else:
+            self._dequantize_images(batch)
             inputs, conditioning = batch[self.image_key], batch[self.text_key]
             if self.sdxl:
                 # If SDXL, separate the conditioning ([B, 2, 77]) from each tokenizer
@@ -330,6 +340,8 @@ class StableDiffusion(ComposerModel):
             metric.update(outputs[0], outputs[1])
         # FID metrics should be updated with the generated images at the desired guidance scale
         elif metric.__class__.__name__ == 'FrechetInceptionDistance':
+            # Batches with precomputed latents skip dequantization in forward
+            self._dequantize_images(batch)
             metric.update(batch[self.image_key], real=True)
             metric.update(outputs[3][metric.guidance_scale], real=False)
         # IS metrics should be updated with the generated images at the desired guidance scale
@@ -0,0 +1,189 @@
+# Copyright 2022 MosaicML Diffusion authors
+# SPDX-License-Identifier: Apache-2.0
+
+"""Attach pre-cropped and normalized images to an image-caption streaming dataset."""
+
+from argparse import ArgumentParser, Namespace
+from io import BytesIO
+from typing import Any, Dict, Iterable
+
+import numpy as np
+import torch
+from PIL import Image
+from streaming import MDSWriter, StreamingDataset
+from streaming.base.format.mds.encodings import mds_encode
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+
+from diffusion.datasets.laion.transforms import LargestCenterSquare, pil_to_norm_tensor
+
+
+def split_sample_data(shard: Any, data: bytes) -> Dict[str, bytes]:
+    """Splits the raw data of an MDS sample into the encoded bytes of each of its columns.
+
+    Args:
+        shard (Any): The ``MDSReader`` of the shard the sample belongs to.
+        data (bytes): The raw sample data, as returned by ``shard.get_sample_data``.
+
+    Returns:
+        Dict[str, bytes]: The still encoded bytes of each column.
+    """
+    # Variable sized columns are prefixed by a header of their uint32 sizes, like in ``MDSReader.decode_sample``
+    sizes = []
+    idx = 0
+    for size in shard.column_sizes:
+        if size is None:
+            size = int(np.frombuffer(data[idx:idx + 4], np.uint32)[0])
+            idx += 4
+        sizes.append(size)
+    columns = {}
+    for name, size in zip(shard.column_names, sizes):
+        columns[name] = data[idx:idx + size]
+        idx += size
+    return columns
+
+
+class EncodedColumnsMDSWriter(MDSWriter):
+    """``MDSWriter`` that writes some columns from bytes that are already encoded.
+
+    Copying columns as their original bytes avoids re-encoding them, which would be lossy for ``'jpeg'`` columns.
+
+    Args:
+        encoded_columns (Iterable[str]): The columns whose values are already encoded with their column encoding.
+        **kwargs: Additional arguments to pass to ``MDSWriter``.
+    """
+
+    def __init__(self, encoded_columns: Iterable[str], **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.encoded_columns = set(encoded_columns)
+
+    def encode_sample(self, sample: Dict[str, Any]) -> bytes:
+        sizes = []
+        data = []
+        for key, encoding, size in zip(self.column_names, self.column_encodings, self.column_sizes):
+            datum = sample[key] if key in self.encoded_columns else mds_encode(encoding, sample[key])
+            if size is None:
+                sizes.append(len(datum))
+            elif size != len(datum):
+                raise KeyError(f'Unexpected data size for column {key}: expected {size}, got {len(datum)}.')
+            data.append(datum)
+        return np.array(sizes, np.uint32).tobytes() + b''.join(data)
+
+
+class StreamingPrecomputeImageDataset(StreamingDataset):
+    """Streaming dataset that adds a center cropped copy of each image to its sample.
+
+    Existing columns are returned as their original encoded bytes, to be written by ``EncodedColumnsMDSWriter``.
+
+    Args:
+        remote (str): Remote directory (S3 or local filesystem) where the dataset is stored.
+        local (str): Local filesystem directory where the dataset is cached during operation.
+        resize_size (int): The size of the square center crop. Default: ``256``.
+        image_key (str): Key associated with the image in the streaming dataset. Default: ``'image'``.
+        dtype (str): Either ``'float16'`` to store images normalized to [-1, 1], or ``'uint8'`` to store raw pixels.
+            Default: ``'float16'``.
+    """
+
+    def __init__(self,
+                 remote: str,
+                 local: str,
+                 resize_size: int = 256,
+                 image_key: str = 'image',
+                 dtype: str = 'float16') -> None:
+        super().__init__(remote=remote, local=local, shuffle=False)
+        self.resize_size = resize_size
+        self.image_key = image_key
+        self.dtype = dtype
+        self.crop = LargestCenterSquare(resize_size)
+
+    def __getitem__(self, index):
+        # Getting the decoded sample also makes sure its shard is downloaded
+        sample = super().__getitem__(index)
+        shard_id, shard_sample_id = self.spanner[index]
+        shard = self.shards[shard_id]
+        out = split_sample_data(shard, shard.get_sample_data(shard_sample_id))
+
+        img = sample[self.image_key]
+        if not isinstance(img, Image.Image):
+            img = Image.open(BytesIO(img))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        width, height = img.size
+        img, crop_top, crop_left = self.crop(img)
+
+        size = self.resize_size
+        if self.dtype == 'uint8':
+            # Stored channels first to match the normalized images
+            out[f'image_uint8_{size}x{size}'] = np.asarray(img).transpose(2, 0, 1).tobytes()
+        else:
+            out[f'image_fp16_{size}x{size}'] = pil_to_norm_tensor(img).to(torch.float16).numpy().tobytes()
+        out['image_width'] = width
+        out['image_height'] = height
+        out[f'crop_top_{size}'] = crop_top
+        out[f'crop_left_{size}'] = crop_left
+        return out
+
+
+def parse_args() -> Namespace:
+    """Parse command-line arguments.
+
+    Returns:
+        Namespace: Command-line arguments.
+    """
+    args = ArgumentParser()
+    args.add_argument('--remote_download', type=str, required=True, help='Remote path to download MDS shards from.')
+    args.add_argument('--local', type=str, required=True, help='Local directory to cache shards in.')
+    args.add_argument('--remote_upload', type=str, required=True, help='Remote path to upload MDS shards to.')
+    args.add_argument('--resize_size', type=int, default=256, help='Size of the square images to precompute.')
+    args.add_argument('--image_key', type=str, default='image', help='Key of the images to precompute.')
+    args.add_argument('--dtype',
+                      type=str,
+                      default='float16',
+                      choices=['float16', 'uint8'],
+                      help='Store normalized float16 images or raw uint8 pixels.')
+    args.add_argument('--num_workers', type=int, default=8, help='Number of dataloader workers.')
+    return args.parse_args()
+
+
+def main(args: Namespace) -> None:
+    """Add precomputed images to an image-caption dataset.
+
+    Each sample gains an ``image_fp16_{S}x{S}`` column with the ``(3, S, S)`` float16 image normalized to [-1, 1],
+    or an ``image_uint8_{S}x{S}`` column with the ``(3, S, S)`` uint8 pixels, along with the original image size and
+    the crop coordinates used for SDXL microconditioning. Train on the output with ``precomputed_images=True`` and
+    the matching ``precomputed_image_dtype`` in ``build_streaming_image_caption_dataloader``.
+
+    Args:
+        args (Namespace): Command-line arguments.
+    """
+    dataset = StreamingPrecomputeImageDataset(remote=args.remote_download,
+                                              local=args.local,
+                                              resize_size=args.resize_size,
+                                              image_key=args.image_key,
+                                              dtype=args.dtype)
+    # Copy the existing columns as their encoded bytes and add the precomputed ones
+    shard = dataset.shards[0]
+    columns = dict(zip(shard.column_names, shard.column_encodings))  # type: ignore
+    encoded_columns = list(columns)
+    size = args.resize_size
+    if args.dtype == 'uint8':
+        columns[f'image_uint8_{size}x{size}'] = 'bytes'
+    else:
+        columns[f'image_fp16_{size}x{size}'] = 'bytes'
+    columns['image_width'] = 'int'
+    columns['image_height'] = 'int'
+    columns[f'crop_top_{size}'] = 'int'
+    columns[f'crop_left_{size}'] = 'int'
+
+    # batch_size=None yields individual samples without collating them
+    dataloader = DataLoader(dataset, batch_size=None, num_workers=args.num_workers)
+    with EncodedColumnsMDSWriter(encoded_columns=encoded_columns,
+                                 out=args.remote_upload,
+                                 columns=columns,
+                                 compression=None) as writer:
+        for sample in tqdm(dataloader):
+            writer.write(sample)
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -31,6 +31,11 @@ extras_require['dev'] = {
     'pyarrow==14.0.1',
 }
 
+# Compiled image normalization in the dataloader
+extras_require['numba'] = {
+    'numba>=0.57',
+}
+
 extras_require['all'] = set(dep for deps in extras_require.values() for dep in deps)
 
 setup(
@@ -0,0 +1,45 @@
+# Copyright 2022 MosaicML Diffusion authors
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from diffusion.datasets import CUDAPrefetcher
+
+
+class DictDataset(Dataset):
+
+    def __len__(self):
+        return 10
+
+    def __getitem__(self, index):
+        return {'image': torch.full((3, 4, 4), float(index)), 'index': index, 'caption': f'caption {index}'}
+
+
+def collate_fn(batch):
+    return {
+        'image': torch.stack([sample['image'] for sample in batch]),
+        'index': torch.tensor([sample['index'] for sample in batch]),
+        'caption': [sample['caption'] for sample in batch],
+    }
+
+
+@pytest.mark.gpu
+def test_cuda_prefetcher():
+    loader = DataLoader(DictDataset(), batch_size=4, collate_fn=collate_fn, pin_memory=True)
+    prefetcher = CUDAPrefetcher(loader)
+    assert len(prefetcher) == len(loader) == 3
+
+    batches = list(prefetcher)
+    assert len(batches) == 3
+    for batch, expected in zip(batches, loader):
+        # Tensors are moved to the current CUDA device with their values intact
+        for key in ['image', 'index']:
+            assert batch[key].device == torch.device('cuda', torch.cuda.current_device())
+            torch.testing.assert_close(batch[key].cpu(), expected[key])
+        # Other values are passed through unchanged
+        assert batch['caption'] == expected['caption']
+
+    # Each iteration starts a new pass over the loader
+    assert len(list(prefetcher)) == 3
@@ -0,0 +1,163 @@
+# Copyright 2022 MosaicML Diffusion authors
+# SPDX-License-Identifier: Apache-2.0
+
+from io import BytesIO
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from streaming import MDSWriter
+
+from diffusion.datasets.image_caption import StreamingImageCaptionDataset, StreamingImageCaptionGPUDecodeDataset
+from diffusion.datasets.laion.transforms import LargestCenterSquare, pil_to_norm_tensor
+
+CAPTIONS = ['a cool doge', 'a very long caption ' * 20, 'so cool', 'a doge']
+IMAGE_SIZES = [(16, 12), (10, 20), (37, 23), (9, 9)]
+SDXL_TOKENIZER = 'stabilityai/stable-diffusion-xl-base-1.0'
+
+
+def write_dataset(path):
+    rng = np.random.default_rng(0)
+    with MDSWriter(out=str(path), columns={'image': 'png', 'caption': 'str'}) as writer:
+        for i, caption in enumerate(CAPTIONS):
+            pixels = rng.integers(0, 256, size=(12 + 4 * i, 16, 3), dtype=np.uint8)
+            writer.write({'image': Image.fromarray(pixels), 'caption': caption})
+
+
+def write_encoded_dataset(path, image_sizes, image_format='JPEG'):
+    rng = np.random.default_rng(0)
+    encoded_images = []
+    with MDSWriter(out=str(path), columns={'image': 'bytes', 'caption': 'str'}) as writer:
+        for w, h in image_sizes:
+            buffer = BytesIO()
+            Image.fromarray(rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8)).save(buffer, format=image_format)
+            encoded_images.append(buffer.getvalue())
+            writer.write({'image': buffer.getvalue(), 'caption': 'a cool doge'})
+    return encoded_images
+
+
+@pytest.mark.parametrize('sdxl', [False, True])
+@pytest.mark.parametrize('dropped', [[], [1], [0, 1, 2, 3]])
+def test_collate_fn(tmp_path, sdxl, dropped):
+    write_dataset(tmp_path)
+    if sdxl:
+        tokenizer_name_or_path = 'stabilityai/stable-diffusion-xl-base-1.0'
+    else:
+        tokenizer_name_or_path = 'stabilityai/stable-diffusion-2-base'
+    dataset = StreamingImageCaptionDataset(local=str(tmp_path),
+                                           tokenizer_name_or_path=tokenizer_name_or_path,
+                                           crop=LargestCenterSquare(8),
+                                           transform=pil_to_norm_tensor,
+                                           sdxl=sdxl)
+    batch = [dataset[i] for i in range(len(CAPTIONS))]
+    for i in dropped:
+        # Captions dropped by caption_drop_prob are empty
+        batch[i]['captions'] = ''
+    captions = [sample['captions'] for sample in batch]
+    out = dataset.collate_fn(batch)
+
+    batch_size = len(CAPTIONS)
+    assert out['image'].shape == (batch_size, 3, 8, 8)
+    assert out['image'].dtype == torch.float32
+    # Images are batched in the contiguous NCHW layout the model's weights use
+    assert out['image'].is_contiguous()
+    if sdxl:
+        assert out['captions'].shape == (batch_size, 2, 77)
+        for key in ['cond_crops_coords_top_left', 'cond_original_size', 'cond_target_size']:
+            assert out[key].shape == (batch_size, 2)
+            assert out[key].dtype == torch.int64
+    else:
+        assert out['captions'].shape == (batch_size, 77)
+    assert out['captions'].dtype == torch.int64
+    assert out['attention_mask'].shape == (batch_size, 1, 77)
+    assert out['attention_mask'].dtype == torch.int64
+
+    # Each row matches tokenizing its caption on its own
+    for i, caption in enumerate(captions):
+        tokenizer_out = dataset.tokenizer(caption,
+                                          padding='max_length',
+                                          max_length=None if sdxl else 77,
+                                          truncation=True,
+                                          return_tensors='pt')
+        if sdxl:
+            input_ids = torch.cat(tokenizer_out.input_ids)
+            attention_mask = tokenizer_out.attention_mask[0] | tokenizer_out.attention_mask[1]
+        else:
+            input_ids = tokenizer_out.input_ids[0]
+            attention_mask = tokenizer_out.attention_mask
+        torch.testing.assert_close(out['captions'][i], input_ids)
+        torch.testing.assert_close(out['attention_mask'][i], attention_mask)
+
+
+def test_gpu_decode_crop_coords(tmp_path):
+    encoded_images = write_encoded_dataset(tmp_path, IMAGE_SIZES)
+    dataset = StreamingImageCaptionGPUDecodeDataset(local=str(tmp_path),
+                                                    tokenizer_name_or_path=SDXL_TOKENIZER,
+                                                    sdxl=True,
+                                                    resize_size=8)
+    crop = LargestCenterSquare(8)
+    for i, encoded_image in enumerate(encoded_images):
+        sample = dataset[i]
+        # Images are left encoded, but the microconditioning matches cropping them on the CPU
+        assert sample['image'] == encoded_image
+        image = Image.open(BytesIO(encoded_image))
+        _, crop_top, crop_left = crop(image)
+        assert sample['cond_crops_coords_top_left'] == (crop_top, crop_left)
+        assert sample['cond_original_size'] == image.size
+        assert sample['cond_target_size'] == (8, 8)
+
+
+def test_gpu_decode_rejects_unsupported_formats(tmp_path):
+    write_encoded_dataset(tmp_path, IMAGE_SIZES[:1], image_format='GIF')
+    dataset = StreamingImageCaptionGPUDecodeDataset(local=str(tmp_path),
+                                                    tokenizer_name_or_path=SDXL_TOKENIZER,
+                                                    sdxl=True,
+                                                    resize_size=8)
+    with pytest.raises(ValueError, match='GPU decoding only supports'):
+        dataset[0]
+
+
+def test_draft_keeps_original_size(tmp_path):
+    # Large enough for JPEG draft decoding to shrink the image before the crop
+    encoded_images = write_encoded_dataset(tmp_path, [(128, 96), (80, 200)])
+    dataset = StreamingImageCaptionDataset(local=str(tmp_path),
+                                           tokenizer_name_or_path=SDXL_TOKENIZER,
+                                           crop=LargestCenterSquare(8),
+                                           resize_size=8,
+                                           transform=pil_to_norm_tensor,
+                                           sdxl=True)
+    for i, encoded_image in enumerate(encoded_images):
+        sample = dataset[i]
+        image = Image.open(BytesIO(encoded_image))
+        _, crop_top, crop_left = LargestCenterSquare(8)(image)
+        assert sample['image'].shape == (3, 8, 8)
+        assert sample['cond_original_size'] == image.size
+        assert sample['cond_crops_coords_top_left'] == (crop_top, crop_left)
+        assert sample['cond_target_size'] == (8, 8)
+
+
+@pytest.mark.parametrize('microcond_drop_prob', [0.0, 1.0])
+def test_microconditioning(tmp_path, microcond_drop_prob):
+    encoded_images = write_encoded_dataset(tmp_path, IMAGE_SIZES)
+    dataset = StreamingImageCaptionDataset(local=str(tmp_path),
+                                           tokenizer_name_or_path=SDXL_TOKENIZER,
+                                           microcond_drop_prob=microcond_drop_prob,
+                                           crop=LargestCenterSquare(8),
+                                           transform=pil_to_norm_tensor,
+                                           sdxl=True)
+    out = dataset.collate_fn([dataset[i] for i in range(len(encoded_images))])
+
+    expected = {'cond_crops_coords_top_left': [], 'cond_original_size': [], 'cond_target_size': []}
+    for encoded_image in encoded_images:
+        image = Image.open(BytesIO(encoded_image))
+        _, crop_top, crop_left = LargestCenterSquare(8)(image)
+        expected['cond_crops_coords_top_left'].append([crop_top, crop_left])
+        expected['cond_original_size'].append(list(image.size))
+        expected['cond_target_size'].append([8, 8])
+    for key, values in expected.items():
+        expected_values = torch.tensor(values)
+        if microcond_drop_prob == 1.0:
+            # Dropped microconditioning is zeroed
+            expected_values = torch.zeros_like(expected_values)
+        torch.testing.assert_close(out[key], expected_values)
@@ -28,6 +28,27 @@ def test_model_forward():
     assert target.shape == latent.shape
 
 
+def test_model_forward_uint8():
+    # fp16 vae does not run on cpu
+    model = stable_diffusion_2(pretrained=False, fsdp=False, encode_latents_in_fp16=False)
+    batch_size = 1
+    H = 8
+    W = 8
+    image = torch.randint(low=0, high=256, size=(batch_size, 3, H, W), dtype=torch.uint8)
+    latent = torch.randn(batch_size, 4, H // 8, W // 8)
+    caption = torch.randint(low=0, high=128, size=(
+        batch_size,
+        77,
+    ), dtype=torch.long)
+    batch = {'image': image, 'captions': caption}
+    output, target, _ = model(batch)
+    assert output.shape == latent.shape
+    assert target.shape == latent.shape
+    # uint8 images are dequantized to [-1, 1] in the batch, so metrics see the same images as the model
+    assert batch['image'].dtype == torch.float32
+    torch.testing.assert_close(batch['image'], image.float() / 127.5 - 1.0)
+
+
 @pytest.mark.parametrize('guidance_scale', [0.0, 3.0])
 @pytest.mark.parametrize('negative_prompt', [None, 'so cool'])
 def test_model_generate(guidance_scale, negative_prompt):
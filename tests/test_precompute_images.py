@@ -0,0 +1,80 @@
+# Copyright 2022 MosaicML Diffusion authors
+# SPDX-License-Identifier: Apache-2.0
+
+import importlib.util
+import os
+from argparse import Namespace
+from io import BytesIO
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from streaming import MDSWriter
+from streaming.base.format.mds.encodings import mds_encode
+
+from diffusion.datasets.image_caption import StreamingImageCaptionDataset
+from diffusion.datasets.laion.transforms import LargestCenterSquare, pil_to_norm_tensor
+
+IMAGE_SIZES = [(16, 12), (10, 20), (9, 9)]
+SIZE = 8
+
+
+def load_precompute_images():
+    path = os.path.join(os.path.dirname(__file__), '..', 'scripts', 'precompute_images.py')
+    spec = importlib.util.spec_from_file_location('precompute_images', path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_dataset(path):
+    rng = np.random.default_rng(0)
+    encoded_images = []
+    with MDSWriter(out=str(path), columns={'image': 'jpeg', 'caption': 'str'}) as writer:
+        for i, (w, h) in enumerate(IMAGE_SIZES):
+            image = Image.fromarray(rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8))
+            encoded_images.append(mds_encode('jpeg', image))
+            writer.write({'image': image, 'caption': f'caption {i}'})
+    return encoded_images
+
+
+@pytest.mark.parametrize('dtype', ['float16', 'uint8'])
+def test_precompute_images_round_trip(tmp_path, dtype):
+    encoded_images = write_dataset(tmp_path / 'src')
+    precompute_images = load_precompute_images()
+    precompute_images.main(
+        Namespace(remote_download=str(tmp_path / 'src'),
+                  local=str(tmp_path / 'cache'),
+                  remote_upload=str(tmp_path / 'out'),
+                  resize_size=SIZE,
+                  image_key='image',
+                  dtype=dtype,
+                  num_workers=0))
+
+    dataset = StreamingImageCaptionDataset(local=str(tmp_path / 'out'),
+                                           tokenizer_name_or_path='stabilityai/stable-diffusion-xl-base-1.0',
+                                           sdxl=True,
+                                           precomputed_image_size=SIZE,
+                                           precomputed_image_dtype=dtype,
+                                           shuffle=False)
+    crop = LargestCenterSquare(SIZE)
+    shard = dataset.shards[0]
+    for i, encoded_image in enumerate(encoded_images):
+        sample = dataset[i]
+        # Existing columns are copied through without re-encoding the images
+        columns = precompute_images.split_sample_data(shard, shard.get_sample_data(i))
+        assert columns['image'] == encoded_image
+        assert columns['caption'] == f'caption {i}'.encode()
+
+        image = Image.open(BytesIO(encoded_image))
+        cropped, crop_top, crop_left = crop(image)
+        if dtype == 'uint8':
+            np.testing.assert_array_equal(sample['image'], np.asarray(cropped).transpose(2, 0, 1))
+        else:
+            expected = pil_to_norm_tensor(cropped).to(torch.float16).float()
+            torch.testing.assert_close(torch.from_numpy(sample['image']), expected)
+        assert sample['cond_original_size'] == image.size
+        assert sample['cond_crops_coords_top_left'] == (crop_top, crop_left)
+        assert sample['cond_target_size'] == (SIZE, SIZE)
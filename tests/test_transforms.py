@@ -0,0 +1,53 @@
+# Copyright 2022 MosaicML Diffusion authors
+# SPDX-License-Identifier: Apache-2.0
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from diffusion.datasets.laion.transforms import LargestCenterSquare, RandomCropSquare, pil_to_norm_tensor
+
+
+@pytest.mark.parametrize('use_numba', [False, True])
+def test_pil_to_norm_tensor(monkeypatch, use_numba):
+    if use_numba:
+        pytest.importorskip('numba')
+    monkeypatch.setattr('diffusion.datasets.laion.transforms.is_numba_installed', use_numba)
+    rng = np.random.default_rng(0)
+    img = Image.fromarray(rng.integers(0, 256, size=(12, 16, 3), dtype=np.uint8))
+    reference = transforms.Compose([transforms.ToTensor(), transforms.Normalize((0.5,) * 3, (0.5,) * 3)])(img)
+    output = pil_to_norm_tensor(img)
+    assert output.shape == (3, 12, 16)
+    assert output.dtype == torch.float32
+    assert output.is_contiguous()
+    torch.testing.assert_close(output, reference)
+
+
+@pytest.mark.parametrize('image_size', [(16, 12), (10, 20), (8, 8), (37, 23)])
+def test_largest_center_square(image_size):
+    rng = np.random.default_rng(0)
+    w, h = image_size
+    img = Image.fromarray(rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8))
+    cropped, crop_top, crop_left = LargestCenterSquare(8)(img)
+
+    # Matches resizing with torchvision, then center cropping
+    resized = transforms.functional.resize(img, 8, interpolation=transforms.InterpolationMode.BILINEAR, antialias=True)
+    resized_w, resized_h = resized.size
+    assert (crop_top, crop_left) == ((resized_h - 8) // 2, (resized_w - 8) // 2)
+    expected = transforms.functional.crop(resized, crop_top, crop_left, 8, 8)
+    np.testing.assert_array_equal(np.asarray(cropped), np.asarray(expected))
+
+
+@pytest.mark.parametrize('image_size', [(16, 12), (10, 20), (37, 23)])
+def test_random_crop_square(image_size):
+    rng = np.random.default_rng(0)
+    w, h = image_size
+    img = Image.fromarray(rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8))
+    cropped, crop_top, crop_left = RandomCropSquare(8)(img)
+
+    # The crop is taken from the same image torchvision's resize produces
+    resized = transforms.functional.resize(img, 8, interpolation=transforms.InterpolationMode.BILINEAR, antialias=True)
+    expected = transforms.functional.crop(resized, crop_top, crop_left, 8, 8)
+    np.testing.assert_array_equal(np.asarray(cropped), np.asarray(expected))